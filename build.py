@@ -5,12 +5,153 @@ ttp.exe を生成する。
 """
 
 import PyInstaller.__main__
+import os
 import shutil
+import subprocess
+import sys
+import time
 import zipfile
+import zlib
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import deflate  # libdeflate バインディング (zlib より高速)
+except ImportError:
+    deflate = None
+
 from ttp import __version__
 
+def _zip_level() -> int:
+    """環境変数 TTP_ZIP_LEVEL から圧縮レベルを読む。
+
+    同じ値を zlib (0〜9) と libdeflate (1〜12) の両方に渡すので、共通の 1〜9 に限る。
+    """
+    raw = os.environ.get("TTP_ZIP_LEVEL") or "1"
+    if not (raw.isdecimal() and 1 <= int(raw) <= 9):
+        sys.exit(f"TTP_ZIP_LEVEL は 1〜9 の整数で指定してください (指定値: {raw!r})")
+    return int(raw)
+
+
+# 配布 zip の圧縮レベル (PyInstaller の成果物は圧縮済みデータが多く、高レベルは効果が薄い)
+ZIP_LEVEL = _zip_level()
+
+# これ以上のサイズのファイルはメモリに読み込まずストリーミングで圧縮する
+_STREAM_THRESHOLD = 32 * 1024 * 1024
+
+# ストリーミング時の読み込み単位
+_CHUNK_SIZE = 1024 * 1024
+
+# _write_deflated / _write_streamed が依存する zipfile の内部実装を確認した Python
+_ZIP_INTERNALS_VERSIONS = ((3, 12), (3, 13))
+
+
+def _can_write_raw(zf: zipfile.ZipFile) -> bool:
+    """圧縮済みデータを直接書き込む高速経路を使えるか。
+
+    zipfile の非公開属性に依存するため、確認済みのバージョン以外では使わない。
+    """
+    return sys.version_info[:2] in _ZIP_INTERNALS_VERSIONS and all(
+        hasattr(zf, name) for name in ("_lock", "_writecheck", "_didModify", "start_dir", "fp")
+    )
+
+
+def _compress(data: bytes) -> bytes:
+    """raw DEFLATE で圧縮する。libdeflate があれば優先して使う。"""
+    if deflate is not None:
+        return deflate.deflate_compress(data, ZIP_LEVEL)
+    co = zlib.compressobj(ZIP_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return co.compress(data) + co.flush()
+
+
+def _deflate_file(path: str, info: zipfile.ZipInfo) -> tuple[zipfile.ZipInfo, bytes]:
+    """ファイルを読み込んで圧縮し、サイズと CRC を設定した ZipInfo と圧縮データを返す。
+
+    ワーカースレッドから呼ばれる。
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    payload = _compress(data)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.file_size = len(data)
+    info.compress_size = len(payload)
+    info.CRC = zlib.crc32(data)
+    return info, payload
+
+
+def _write_deflated(zf: zipfile.ZipFile, info: zipfile.ZipInfo, payload: bytes) -> None:
+    """圧縮済みデータを zip エントリとして書き込む。
+
+    zipfile は圧縮処理を差し替えられないため、ZipFile.mkdir と同じ手順で
+    ローカルヘッダとデータを直接書き込む。_can_write_raw() が真の場合だけ使う。
+    """
+    with zf._lock:
+        zf.fp.seek(zf.start_dir)
+        info.header_offset = zf.fp.tell()
+        zf._writecheck(info)
+        zf._didModify = True
+        zf.fp.write(info.FileHeader())
+        zf.fp.write(payload)
+        zf.filelist.append(info)
+        zf.NameToInfo[info.filename] = info
+        zf.start_dir = zf.fp.tell()
+
+
+def _write_streamed(zf: zipfile.ZipFile, info: zipfile.ZipInfo, path: str) -> None:
+    """大きなファイルを大きめのバッファで読みながら zlib で圧縮して書き込む。"""
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info._compresslevel = ZIP_LEVEL
+    with open(path, "rb", buffering=_CHUNK_SIZE) as src, zf.open(info, "w") as dst:
+        shutil.copyfileobj(src, dst, _CHUNK_SIZE)
+
+
+def _walk_files(root: Path, prefix: str) -> Iterator[tuple[os.DirEntry[str], str]]:
+    """root 以下のファイルを (DirEntry, zip 内パス) の組で列挙する。"""
+    stack = [(str(root), prefix)]
+    while stack:
+        path, arc_dir = stack.pop()
+        with os.scandir(path) as it:
+            for entry in it:
+                arcname = f"{arc_dir}/{entry.name}"
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, arcname))
+                else:
+                    yield entry, arcname
+
+
+def _zipinfo_from_entry(entry: os.DirEntry[str], arcname: str) -> zipfile.ZipInfo:
+    """DirEntry のキャッシュ済み stat から ZipInfo を作る (ZipInfo.from_file の再 stat を避ける)。"""
+    st = entry.stat()
+    info = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[:6])
+    info.external_attr = (st.st_mode & 0xFFFF) << 16
+    info.file_size = st.st_size
+    return info
+
+
+def _scandir_rmtree(path: str) -> None:
+    """os.scandir で走査しながらディレクトリツリーを削除する。"""
+    with os.scandir(path) as it:
+        for entry in it:
+            # DirEntry は種別をキャッシュしているので追加の stat は発生しない
+            if entry.is_dir(follow_symlinks=False):
+                _scandir_rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+    os.rmdir(path)
+
+
+def _fast_rmtree(path: Path) -> None:
+    """ビルド成果物のディレクトリを削除する。"""
+    if sys.platform == "win32":
+        # Windows では rmdir /s /q に任せた方がファイル毎の属性確認が無く速い
+        subprocess.run(["cmd", "/c", "rmdir", "/s", "/q", str(path)], check=True)
+        # rmdir はロック中のファイルがあっても終了コード 0 を返すことがある
+        if path.exists():
+            raise OSError(f"{path} を削除できませんでした (使用中のファイルがないか確認してください)")
+    else:
+        _scandir_rmtree(str(path))
+
 
 def build() -> None:
     dist_dir = Path("dist")
@@ -18,9 +159,9 @@ def build() -> None:
 
     # クリーンアップ
     if dist_dir.exists():
-        shutil.rmtree(dist_dir)
+        _fast_rmtree(dist_dir)
     if build_dir.exists():
-        shutil.rmtree(build_dir)
+        _fast_rmtree(build_dir)
 
     PyInstaller.__main__.run(
         [
@@ -46,10 +187,31 @@ def build() -> None:
     zip_name = f"ttp-{__version__}.zip"
     zip_path = dist_dir / zip_name
     print(f"\nzip 作成中: {zip_path}")
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-        for file in out.rglob("*"):
-            arcname = f"ttp/{file.relative_to(out)}"
-            zf.write(file, arcname)
+    entries = [
+        (entry.path, _zipinfo_from_entry(entry, arcname))
+        for entry, arcname in _walk_files(out, "ttp")
+    ]
+    with zipfile.ZipFile(
+        zip_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=ZIP_LEVEL
+    ) as zf:
+        if _can_write_raw(zf):
+            # 圧縮はスレッドで並列に行い、書き込みは列挙順に1スレッドで行う
+            with ThreadPoolExecutor() as pool:
+                futures: list[Future[tuple[zipfile.ZipInfo, bytes]] | None] = [
+                    None
+                    if info.file_size >= _STREAM_THRESHOLD
+                    else pool.submit(_deflate_file, path, info)
+                    for path, info in entries
+                ]
+                for (path, info), future in zip(entries, futures):
+                    if future is None:
+                        _write_streamed(zf, info, path)
+                    else:
+                        _write_deflated(zf, *future.result())
+        else:
+            # 未確認の Python では zipfile の公開 API だけで書き込む
+            for path, info in entries:
+                zf.write(path, info.filename)
         # logs/ は空フォルダなので明示的にディレクトリエントリを追加
         zf.mkdir("ttp/logs/")
 
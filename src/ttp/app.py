@@ -5,9 +5,10 @@
 
 from __future__ import annotations
 
-import copy
+import dataclasses
+import functools
+import operator
 import os
-import subprocess
 import tkinter as tk
 from tkinter import ttk, messagebox
 
@@ -19,7 +20,7 @@ from ttp.storage import (
     SettingsStore,
     get_log_dir,
 )
-from ttp.teraterm import launch_connection
+from ttp.teraterm import launch_connection, ttpmacro_exists
 from ttp.dialogs import (
     SetMasterPasswordDialog,
     EnterMasterPasswordDialog,
@@ -29,6 +30,14 @@ from ttp.dialogs import (
     ChangeMasterPasswordDialog,
 )
 
+# Treeview の列名 → Connection の属性名
+_COL_MAP = {"name": "name", "host": "host", "port": "port", "auth": "auth_type", "user": "username"}
+
+# Treeview に全行をまとめて挿入する Tcl の無名関数 (行ごとに Python↔Tcl を往復しない)
+_INSERT_ROWS_TCL = (
+    "{w rows} {foreach {iid values} $rows {$w insert {} end -id $iid -values $values}}"
+)
+
 
 class TTPApp:
     """メインアプリケーション"""
@@ -60,9 +69,7 @@ class TTPApp:
         self._connections = self._conn_store.load(self._key)
 
         # ttpmacro パスが未設定なら選択ダイアログ
-        if not self._settings.ttpmacro_path or not os.path.isfile(
-            self._settings.ttpmacro_path
-        ):
+        if not ttpmacro_exists(self._settings.ttpmacro_path):
             self._select_ttpmacro()
             if not self._settings.ttpmacro_path:
                 self._root.destroy()
@@ -90,30 +97,35 @@ class TTPApp:
         """マスターパスワードの設定 or 入力を行う。"""
         if not self._master_store.exists():
             # 初回: パスワード設定
-            dlg = SetMasterPasswordDialog(self._root)
-            if dlg.result is None:
+            set_dlg = SetMasterPasswordDialog(self._root)
+            if set_dlg.result is None:
                 return False
-            self._key = self._master_store.setup(dlg.result)
+            self._key = self._master_store.setup_with_connections(set_dlg.result, self._conn_store)
             return True
         else:
-            # 既存: パスワード入力 (最大3回)
-            for attempt in range(3):
-                dlg = EnterMasterPasswordDialog(self._root)
-                if dlg.result is None:
-                    return False
-                key = self._master_store.unlock(dlg.result)
-                if key is not None:
-                    self._key = key
-                    return True
-                remaining = 2 - attempt
-                if remaining > 0:
-                    messagebox.showerror(
-                        "認証エラー",
-                        f"パスワードが違います。\nあと{remaining}回試行できます。",
-                    )
-                else:
-                    messagebox.showerror("認証エラー", "認証に失敗しました。")
-            return False
+            # 既存: パスワード入力 (最大3回、ダイアログは使い回す)
+            enter_dlg = EnterMasterPasswordDialog(self._root)
+            try:
+                for attempt in range(3):
+                    if attempt > 0:
+                        enter_dlg.show()
+                    if enter_dlg.result is None:
+                        return False
+                    key = self._master_store.unlock(enter_dlg.result)
+                    if key is not None:
+                        self._key = key
+                        return True
+                    remaining = 2 - attempt
+                    if remaining > 0:
+                        messagebox.showerror(
+                            "認証エラー",
+                            f"パスワードが違います。\nあと{remaining}回試行できます。",
+                        )
+                    else:
+                        messagebox.showerror("認証エラー", "認証に失敗しました。")
+                return False
+            finally:
+                enter_dlg.close()
 
     def _select_ttpmacro(self) -> None:
         """ttpmacro.exe を選択する。"""
@@ -174,11 +186,11 @@ class TTPApp:
         self._tree = ttk.Treeview(
             tree_frame, columns=columns, show="headings", selectmode="browse"
         )
-        self._tree.heading("name", text="名前", command=lambda: self._sort_column("name"))
-        self._tree.heading("host", text="ホスト", command=lambda: self._sort_column("host"))
-        self._tree.heading("port", text="ポート", command=lambda: self._sort_column("port"))
-        self._tree.heading("auth", text="認証", command=lambda: self._sort_column("auth"))
-        self._tree.heading("user", text="ユーザ", command=lambda: self._sort_column("user"))
+        self._tree.heading("name", text="名前", command=functools.partial(self._sort_column, "name"))
+        self._tree.heading("host", text="ホスト", command=functools.partial(self._sort_column, "host"))
+        self._tree.heading("port", text="ポート", command=functools.partial(self._sort_column, "port"))
+        self._tree.heading("auth", text="認証", command=functools.partial(self._sort_column, "auth"))
+        self._tree.heading("user", text="ユーザ", command=functools.partial(self._sort_column, "user"))
 
         self._tree.column("name", width=150, minwidth=80)
         self._tree.column("host", width=220, minwidth=100)
@@ -249,13 +261,22 @@ class TTPApp:
     def _refresh_list(self) -> None:
         """Treeview を現在の接続リストで更新する。"""
         self._tree.delete(*self._tree.get_children())
-        for i, conn in enumerate(self._connections):
-            self._tree.insert(
-                "",
-                tk.END,
-                iid=str(i),
-                values=(conn.name, conn.host, conn.port, conn.display_auth, conn.username),
-            )
+        rows: list[object] = []
+        for conn in self._connections:
+            rows.append(conn.id)
+            rows.append(self._row_values(conn))
+        self._tree.tk.call("apply", _INSERT_ROWS_TCL, str(self._tree), tuple(rows))
+        self._update_status()
+
+    @staticmethod
+    def _row_values(conn: Connection) -> tuple[object, ...]:
+        return (conn.name, conn.host, conn.port, conn.display_auth, conn.username)
+
+    def _insert_row(self, conn: Connection) -> None:
+        """接続を一覧の末尾に追加して選択する。"""
+        self._tree.insert("", tk.END, iid=conn.id, values=self._row_values(conn))
+        self._tree.selection_set(conn.id)
+        self._tree.see(conn.id)
         self._update_status()
 
     def _update_status(self) -> None:
@@ -267,16 +288,19 @@ class TTPApp:
         sel = self._tree.selection()
         if not sel:
             return None
-        return int(sel[0])
+        # Treeview の iid は Connection.id
+        for i, conn in enumerate(self._connections):
+            if conn.id == sel[0]:
+                return i
+        return None
 
     def _save_connections(self) -> None:
         self._conn_store.save(self._connections, self._key)
 
     def _sort_column(self, col: str) -> None:
         """列ヘッダークリックでソート。"""
-        col_map = {"name": "name", "host": "host", "port": "port", "auth": "auth_type", "user": "username"}
-        attr = col_map.get(col, col)
-        self._connections.sort(key=lambda c: getattr(c, attr, ""), reverse=self._sort_reverse)
+        attr = _COL_MAP.get(col, col)
+        self._connections.sort(key=operator.attrgetter(attr), reverse=self._sort_reverse)
         self._sort_reverse = not self._sort_reverse
         self._refresh_list()
 
@@ -289,28 +313,32 @@ class TTPApp:
             return
         conn = self._connections[idx]
 
-        if not os.path.isfile(self._settings.ttpmacro_path):
-            messagebox.showerror(
-                "エラー",
-                "ttpmacro.exe が見つかりません。\n設定で正しいパスを指定してください。",
-            )
+        if not ttpmacro_exists(self._settings.ttpmacro_path):
+            self._show_ttpmacro_missing()
             return
 
         proc = launch_connection(conn, self._settings)
         if proc is None:
-            messagebox.showerror("エラー", "接続の起動に失敗しました。")
+            # 起動に失敗したら ttpmacro.exe が消えていないか確認し直す
+            if not ttpmacro_exists(self._settings.ttpmacro_path):
+                self._show_ttpmacro_missing()
+            else:
+                messagebox.showerror("エラー", "接続の起動に失敗しました。")
         # 起動成功: テラタームが開く (別プロセス)
 
+    def _show_ttpmacro_missing(self) -> None:
+        messagebox.showerror(
+            "エラー",
+            "ttpmacro.exe が見つかりません。\n設定で正しいパスを指定してください。",
+        )
+
     def _on_add(self) -> None:
         dlg = ConnectionDialog(self._root)
         if dlg.result:
             self._connections.append(dlg.result)
             self._save_connections()
-            self._refresh_list()
             # 追加した項目を選択
-            last_idx = len(self._connections) - 1
-            self._tree.selection_set(str(last_idx))
-            self._tree.see(str(last_idx))
+            self._insert_row(dlg.result)
 
     def _on_edit(self) -> None:
         idx = self._get_selected_index()
@@ -322,27 +350,28 @@ class TTPApp:
         if dlg.result:
             self._connections[idx] = dlg.result
             self._save_connections()
-            self._refresh_list()
-            self._tree.selection_set(str(idx))
+            self._tree.item(conn.id, values=self._row_values(dlg.result))
+            self._tree.selection_set(conn.id)
 
     def _on_duplicate(self) -> None:
         idx = self._get_selected_index()
         if idx is None:
             messagebox.showinfo("選択", "複製する接続先を選択してください。")
             return
-        conn = copy.deepcopy(self._connections[idx])
-        conn.id = Connection().id  # 新しいID
-        conn.name = f"{conn.name} (コピー)"
         from datetime import datetime
 
-        conn.created_at = datetime.now().isoformat()
-        conn.updated_at = conn.created_at
+        src = self._connections[idx]
+        now = datetime.now().isoformat()
+        conn = dataclasses.replace(
+            src,
+            id=Connection().id,  # 新しいID
+            name=f"{src.name} (コピー)",
+            created_at=now,
+            updated_at=now,
+        )
         self._connections.append(conn)
         self._save_connections()
-        self._refresh_list()
-        last_idx = len(self._connections) - 1
-        self._tree.selection_set(str(last_idx))
-        self._tree.see(str(last_idx))
+        self._insert_row(conn)
 
     def _on_delete(self) -> None:
         idx = self._get_selected_index()
@@ -353,7 +382,8 @@ class TTPApp:
         if messagebox.askyesno("確認", f"「{conn.name}」を削除しますか？"):
             self._connections.pop(idx)
             self._save_connections()
-            self._refresh_list()
+            self._tree.delete(conn.id)
+            self._update_status()
 
     def _on_open_logs(self) -> None:
         log_dir = get_log_dir(self._settings)
@@ -374,14 +404,14 @@ class TTPApp:
         if dlg.old_password is None or dlg.new_password is None:
             return
 
-        old_key = self._master_store.unlock(dlg.old_password)
-        if old_key is None:
+        keys = self._master_store.change_password(
+            dlg.old_password, dlg.new_password, self._conn_store
+        )
+        if keys is None:
             messagebox.showerror("エラー", "現在のパスワードが正しくありません。")
             return
 
-        new_key = self._master_store.setup(dlg.new_password)
-        self._conn_store.re_encrypt(old_key, new_key)
-        self._key = new_key
+        _, self._key = keys
         messagebox.showinfo("完了", "マスターパスワードを変更しました。")
 
 
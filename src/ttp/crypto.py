@@ -6,7 +6,10 @@
 from __future__ import annotations
 
 import base64
+import functools
+import hmac
 import os
+import time
 
 from cryptography.fernet import Fernet, InvalidToken
 from cryptography.hazmat.primitives import hashes
@@ -15,34 +18,77 @@ from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 # パスワード検証用の固定文字列
 _VERIFY_PLAINTEXT = b"TTP_MASTER_VERIFY"
 
-# PBKDF2 イテレーション回数 (OWASP 推奨)
+# PBKDF2 イテレーション回数 (OWASP 推奨)。キャリブレーション結果の下限も兼ねる
 _ITERATIONS = 480_000
 
+# キャリブレーション結果の上限。ttp_data/ は別の PC に持ち運べるので、
+# 速い PC で決めた回数が遅い PC で数秒の待ちにならない程度に抑える
+_MAX_ITERATIONS = 1_000_000
+
+# 鍵導出にかける目標時間 (秒)
+_TARGET_SECONDS = 0.25
+
+# キャリブレーションの計測に使うイテレーション回数と計測回数
+_CALIBRATION_ITERATIONS = 100_000
+_CALIBRATION_ROUNDS = 3
+
 
 def generate_salt() -> bytes:
     """ランダムな16バイトのsaltを生成する。"""
     return os.urandom(16)
 
 
-def derive_key(master_password: str, salt: bytes) -> bytes:
-    """マスターパスワードとsaltからFernet鍵を導出する。"""
+def _pbkdf2_sha256(password: bytes, salt: bytes, iterations: int) -> bytes:
+    """PBKDF2-HMAC-SHA256 で32バイトの鍵を導出する。"""
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,
         salt=salt,
-        iterations=_ITERATIONS,
+        iterations=iterations,
     )
-    return base64.urlsafe_b64encode(kdf.derive(master_password.encode("utf-8")))
+    return kdf.derive(password)
+
+
+def calibrate_iterations(target_seconds: float = _TARGET_SECONDS) -> int:
+    """この環境で鍵導出が target_seconds 程度になるイテレーション回数を返す。
+
+    OWASP 推奨値を下回ることはない。計測は数回行い、最速の値を使う
+    (他の処理による遅れで回数が揺れないように)。
+    """
+    elapsed = float("inf")
+    for _ in range(_CALIBRATION_ROUNDS):
+        start = time.perf_counter()
+        _pbkdf2_sha256(b"calibrate", bytes(16), _CALIBRATION_ITERATIONS)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    if elapsed <= 0:
+        return _ITERATIONS
+    iterations = int(_CALIBRATION_ITERATIONS * target_seconds / elapsed) // 1000 * 1000
+    return min(max(iterations, _ITERATIONS), _MAX_ITERATIONS)
+
+
+def derive_key(master_password: str, salt: bytes, iterations: int | None = None) -> bytes:
+    """マスターパスワードとsaltからFernet鍵を導出する。
+
+    iterations 省略時は従来の固定値を使う (iterations を保存していない master.json 向け)。
+    """
+    derived = _pbkdf2_sha256(master_password.encode("utf-8"), salt, iterations or _ITERATIONS)
+    return base64.urlsafe_b64encode(derived)
+
+
+@functools.lru_cache(maxsize=4)
+def _fernet(key: bytes) -> Fernet:
+    """鍵ごとの Fernet インスタンスを返す (鍵のデコードを毎回行わない)。"""
+    return Fernet(key)
 
 
 def encrypt(data: bytes, key: bytes) -> bytes:
     """データをFernetで暗号化する。"""
-    return Fernet(key).encrypt(data)
+    return _fernet(key).encrypt(data)
 
 
 def decrypt(data: bytes, key: bytes) -> bytes:
     """データをFernetで復号化する。InvalidToken例外が出る場合はパスワード不一致。"""
-    return Fernet(key).decrypt(data)
+    return _fernet(key).decrypt(data)
 
 
 def create_verify_token(key: bytes) -> bytes:
@@ -53,6 +99,6 @@ def create_verify_token(key: bytes) -> bytes:
 def verify_master_password(token: bytes, key: bytes) -> bool:
     """マスターパスワードが正しいか検証する。"""
     try:
-        return decrypt(token, key) == _VERIFY_PLAINTEXT
+        return hmac.compare_digest(decrypt(token, key), _VERIFY_PLAINTEXT)
     except InvalidToken:
         return False
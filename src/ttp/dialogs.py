@@ -17,17 +17,27 @@ from ttp.teraterm import search_ttpmacro
 
 # ── ユーティリティ ──────────────────────────────────────────
 
+# 補足ラベル用の小さいフォント (既定のフォントファミリー)
+_SMALL_FONT = ("", 9)
+
 
 def _center_window(win: tk.Toplevel | tk.Tk, width: int, height: int) -> None:
     """ウィンドウを画面中央に配置し、最前面にする。"""
-    win.update_idletasks()
+    # サイズは指定値を使うのでレイアウト確定 (update_idletasks) を待つ必要はない
     x = (win.winfo_screenwidth() - width) // 2
     y = (win.winfo_screenheight() - height) // 2
     win.geometry(f"{width}x{height}+{x}+{y}")
-    win.attributes("-topmost", True)
-    win.after(100, lambda: win.attributes("-topmost", False))
-    win.lift()
-    win.focus_force()
+
+    def bring_to_front() -> None:
+        if not win.winfo_exists():
+            return
+        win.attributes("-topmost", True)
+        win.lift()
+        win.focus_force()
+        win.attributes("-topmost", False)
+
+    # 最前面化はウィンドウ表示後にまとめて行う
+    win.after_idle(bring_to_front)
 
 
 def _setup_dialog(dlg: tk.Toplevel, parent: tk.Tk | tk.Toplevel) -> None:
@@ -105,16 +115,19 @@ class SetMasterPasswordDialog:
 
 
 class EnterMasterPasswordDialog:
-    """起動時のマスターパスワード入力ダイアログ。"""
+    """起動時のマスターパスワード入力ダイアログ。
+
+    生成時に1回表示する。パスワード違いで再入力させる場合は作り直さずに
+    show() で再表示し、不要になったら close() で破棄する。
+    """
 
     def __init__(self, parent: tk.Tk) -> None:
         self.result: str | None = None
+        self._parent = parent
         self._dlg = tk.Toplevel(parent)
         self._dlg.title("マスターパスワード")
         self._dlg.resizable(False, False)
-        _setup_dialog(self._dlg, parent)
-
-        _center_window(self._dlg, 380, 160)
+        self._done = tk.BooleanVar(self._dlg)
 
         frame = ttk.Frame(self._dlg, padding=20)
         frame.pack(fill=tk.BOTH, expand=True)
@@ -132,10 +145,28 @@ class EnterMasterPasswordDialog:
         ttk.Button(btn_frame, text="OK", command=self._on_ok, width=12).pack(side=tk.LEFT, padx=4)
         ttk.Button(btn_frame, text="終了", command=self._on_cancel, width=12).pack(side=tk.LEFT, padx=4)
 
-        self._pw.focus_set()
         self._dlg.bind("<Return>", lambda e: self._on_ok())
         self._dlg.protocol("WM_DELETE_WINDOW", self._on_cancel)
-        self._dlg.wait_window()
+        self.show()
+
+    def show(self) -> str | None:
+        """入力欄を空にしてダイアログを表示し、閉じられるまで待つ。"""
+        self.result = None
+        self._pw.delete(0, tk.END)
+        self._dlg.deiconify()
+        _setup_dialog(self._dlg, self._parent)
+        _center_window(self._dlg, 380, 160)
+        self._pw.focus_set()
+        self._dlg.wait_variable(self._done)
+        return self.result
+
+    def close(self) -> None:
+        self._dlg.destroy()
+
+    def _hide(self) -> None:
+        self._dlg.grab_release()
+        self._dlg.withdraw()
+        self._done.set(True)
 
     def _on_ok(self) -> None:
         pw = self._pw.get()
@@ -143,11 +174,11 @@ class EnterMasterPasswordDialog:
             messagebox.showwarning("入力エラー", "パスワードを入力してください。", parent=self._dlg)
             return
         self.result = pw
-        self._dlg.destroy()
+        self._hide()
 
     def _on_cancel(self) -> None:
         self.result = None
-        self._dlg.destroy()
+        self._hide()
 
 
 # ── ttpmacro.exe 選択ダイアログ ─────────────────────────────
@@ -168,37 +199,23 @@ class SelectTTpmacroDialog:
         frame = ttk.Frame(self._dlg, padding=20)
         frame.pack(fill=tk.BOTH, expand=True)
 
-        # 自動検索
-        found = search_ttpmacro()
-
-        if found:
-            ttk.Label(
-                frame,
-                text="ttpmacro.exe が見つかりました。\n使用するものを選んでください。",
-                justify=tk.LEFT,
-            ).pack(anchor=tk.W, pady=(0, 10))
-
-            self._var = tk.StringVar(value=found[0])
-            for path in found:
-                ttk.Radiobutton(
-                    frame, text=path, variable=self._var, value=path
-                ).pack(anchor=tk.W, padx=10, pady=2)
-        else:
-            ttk.Label(
-                frame,
-                text="ttpmacro.exe が見つかりませんでした。\n手動で選択してください。",
-                justify=tk.LEFT,
-            ).pack(anchor=tk.W, pady=(0, 10))
-            self._var = tk.StringVar()
+        self._message = ttk.Label(frame, justify=tk.LEFT)
+        self._message.pack(anchor=tk.W, pady=(0, 10))
 
         ttk.Separator(frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=10)
 
+        # 検索結果は候補の数によらず1つのコンボボックスで表示する (直接入力も可)
         path_frame = ttk.Frame(frame)
         path_frame.pack(fill=tk.X)
         ttk.Label(path_frame, text="パス:").pack(side=tk.LEFT)
-        self._path_entry = ttk.Entry(path_frame, textvariable=self._var, width=45)
-        self._path_entry.pack(side=tk.LEFT, padx=5)
+        self._var = tk.StringVar()
+        self._path_combo = ttk.Combobox(path_frame, textvariable=self._var, width=45)
+        self._path_combo.pack(side=tk.LEFT, padx=5)
         ttk.Button(path_frame, text="参照...", command=self._browse).pack(side=tk.LEFT)
+        ttk.Button(path_frame, text="再検索", command=self._rescan).pack(side=tk.LEFT, padx=(5, 0))
+
+        # 自動検索 (直近の結果はキャッシュされる。再検索ボタンで更新する)
+        self._show_found(search_ttpmacro())
 
         btn_frame = ttk.Frame(frame)
         btn_frame.pack(pady=(15, 0))
@@ -209,6 +226,23 @@ class SelectTTpmacroDialog:
         self._dlg.protocol("WM_DELETE_WINDOW", self._on_cancel)
         self._dlg.wait_window()
 
+    def _show_found(self, found: list[str]) -> None:
+        """自動検索の結果を表示する。"""
+        self._path_combo.config(values=found)
+        if found:
+            self._message.config(
+                text="ttpmacro.exe が見つかりました。\n使用するものを選んでください。"
+            )
+            if not self._var.get():
+                self._var.set(found[0])
+        else:
+            self._message.config(
+                text="ttpmacro.exe が見つかりませんでした。\n手動で選択してください。"
+            )
+
+    def _rescan(self) -> None:
+        self._show_found(search_ttpmacro(force=True))
+
     def _browse(self) -> None:
         path = filedialog.askopenfilename(
             title="ttpmacro.exe を選択",
@@ -240,6 +274,9 @@ class SelectTTpmacroDialog:
 class ConnectionDialog:
     """接続先を追加・編集するダイアログ。"""
 
+    # _build_advanced が使う行数 (セパレータ、見出し、プロンプト、ログイン後CMD)
+    _ADVANCED_ROWS = 4
+
     def __init__(self, parent: tk.Tk, connection: Connection | None = None) -> None:
         self.result: Connection | None = None
         self._conn = connection  # 編集時は既存のConnection
@@ -254,7 +291,44 @@ class ConnectionDialog:
 
         frame = ttk.Frame(self._dlg, padding=20)
         frame.pack(fill=tk.BOTH, expand=True)
+        self._frame = frame
 
+        # 詳細設定は基本項目の次の行から
+        self._advanced_row = self._build_basic(frame)
+
+        # ボタン (詳細設定の行は後から _build_advanced で埋める)
+        self._btn_frame = ttk.Frame(frame)
+        self._btn_frame.grid(
+            row=self._advanced_row + self._ADVANCED_ROWS, column=0, columnspan=3, pady=(15, 0)
+        )
+        ttk.Button(self._btn_frame, text="保存", command=self._on_save, width=12).pack(side=tk.LEFT, padx=4)
+        ttk.Button(self._btn_frame, text="キャンセル", command=self._on_cancel, width=12).pack(side=tk.LEFT, padx=4)
+
+        # 既存データの反映
+        if connection:
+            self._name.insert(0, connection.name)
+            self._host.insert(0, connection.host)
+            self._port.insert(0, str(connection.port))
+            self._auth_var.set(connection.auth_type)
+            self._user.insert(0, connection.username)
+            self._passwd.insert(0, connection.password)
+            if connection.key_path:
+                self._key_label.config(text=Path(connection.key_path).name)
+        else:
+            self._port.insert(0, "22")
+
+        # 詳細設定は最初の描画後に作る
+        self._advanced_built = False
+        self._dlg.after_idle(self._build_advanced)
+
+        self._on_auth_change()
+        self._name.focus_set()
+        self._dlg.bind("<Return>", lambda e: self._on_save())
+        self._dlg.protocol("WM_DELETE_WINDOW", self._on_cancel)
+        self._dlg.wait_window()
+
+    def _build_basic(self, frame: ttk.Frame) -> int:
+        """基本項目 (表示名〜鍵ファイル) のウィジェットを作り、次の空き行を返す。"""
         row = 0
 
         # 表示名
@@ -321,13 +395,30 @@ class ConnectionDialog:
         self._key_clear_btn.pack(side=tk.LEFT)
         row += 1
 
+        # 前後の空白を除いて読み取る入力欄 (キーは Connection のフィールド名)
+        self._entries: dict[str, ttk.Entry] = {
+            "name": self._name,
+            "host": self._host,
+            "port": self._port,
+            "username": self._user,
+        }
+        return row
+
+    def _build_advanced(self) -> None:
+        """詳細設定 (任意項目) のウィジェットを作る。何度呼んでも1回だけ作る。"""
+        if self._advanced_built or not self._dlg.winfo_exists():
+            return
+        self._advanced_built = True
+        frame = self._frame
+        row = self._advanced_row
+
         # 詳細設定セパレータ
         ttk.Separator(frame, orient=tk.HORIZONTAL).grid(
             row=row, column=0, columnspan=3, sticky=tk.EW, pady=10
         )
         row += 1
 
-        ttk.Label(frame, text="▼ 詳細設定 (任意)", font=("", 9)).grid(
+        ttk.Label(frame, text="▼ 詳細設定 (任意)", font=_SMALL_FONT).grid(
             row=row, column=0, columnspan=3, sticky=tk.W, pady=(0, 5)
         )
         row += 1
@@ -342,34 +433,16 @@ class ConnectionDialog:
         ttk.Label(frame, text="ログイン後CMD:").grid(row=row, column=0, sticky=tk.E, padx=(0, 8), pady=4)
         self._sendln = ttk.Entry(frame, width=35)
         self._sendln.grid(row=row, column=1, columnspan=2, sticky=tk.W, pady=4)
-        row += 1
 
-        # ボタン
-        btn_frame = ttk.Frame(frame)
-        btn_frame.grid(row=row, column=0, columnspan=3, pady=(15, 0))
-        ttk.Button(btn_frame, text="保存", command=self._on_save, width=12).pack(side=tk.LEFT, padx=4)
-        ttk.Button(btn_frame, text="キャンセル", command=self._on_cancel, width=12).pack(side=tk.LEFT, padx=4)
+        self._entries["prompt"] = self._prompt
+        self._entries["sendln_param"] = self._sendln
 
-        # 既存データの反映
-        if connection:
-            self._name.insert(0, connection.name)
-            self._host.insert(0, connection.host)
-            self._port.insert(0, str(connection.port))
-            self._auth_var.set(connection.auth_type)
-            self._user.insert(0, connection.username)
-            self._passwd.insert(0, connection.password)
-            self._prompt.insert(0, connection.prompt)
-            self._sendln.insert(0, connection.sendln_param)
-            if connection.key_path:
-                self._key_label.config(text=Path(connection.key_path).name)
-        else:
-            self._port.insert(0, "22")
+        if self._conn:
+            self._prompt.insert(0, self._conn.prompt)
+            self._sendln.insert(0, self._conn.sendln_param)
 
-        self._on_auth_change()
-        self._name.focus_set()
-        self._dlg.bind("<Return>", lambda e: self._on_save())
-        self._dlg.protocol("WM_DELETE_WINDOW", self._on_cancel)
-        self._dlg.wait_window()
+        # Tab の移動順を画面の並び (詳細設定 → ボタン) に合わせる
+        self._btn_frame.lift()
 
     def _on_auth_change(self) -> None:
         is_key = self._auth_var.get() == "publickey"
@@ -401,9 +474,11 @@ class ConnectionDialog:
         self._key_label.config(text="(未選択)")
 
     def _on_save(self) -> None:
-        name = self._name.get().strip()
-        host = self._host.get().strip()
-        port_str = self._port.get().strip()
+        self._build_advanced()
+        values = {field: entry.get().strip() for field, entry in self._entries.items()}
+        name = values["name"]
+        host = values["host"]
+        port_str = values["port"]
 
         if not name:
             messagebox.showwarning("入力エラー", "表示名を入力してください。", parent=self._dlg)
@@ -411,11 +486,11 @@ class ConnectionDialog:
         if not host:
             messagebox.showwarning("入力エラー", "ホストを入力してください。", parent=self._dlg)
             return
-        try:
-            port = int(port_str)
-        except ValueError:
-            messagebox.showwarning("入力エラー", "ポートは数値で入力してください。", parent=self._dlg)
+        # isdecimal() は int() が受け付ける数字だけを通すので例外を使わずに判定できる
+        if not port_str.isdecimal() or not 0 < int(port_str) < 65536:
+            messagebox.showwarning("入力エラー", "ポートは1〜65535の数値で入力してください。", parent=self._dlg)
             return
+        port = int(port_str)
 
         auth_type = self._auth_var.get()
         if auth_type == "publickey" and not self._key_path:
@@ -432,11 +507,11 @@ class ConnectionDialog:
             host=host,
             port=port,
             auth_type=auth_type,
-            username=self._user.get().strip(),
+            username=values["username"],
             password=self._passwd.get(),
             key_path=self._key_path,
-            prompt=self._prompt.get().strip(),
-            sendln_param=self._sendln.get().strip(),
+            prompt=values["prompt"],
+            sendln_param=values["sendln_param"],
             id=conn_id,
             created_at=self._conn.created_at if self._conn else now,
             updated_at=now,
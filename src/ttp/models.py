@@ -2,16 +2,24 @@
 
 from __future__ import annotations
 
-import uuid
-from dataclasses import dataclass, field, asdict
+import os
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any
+from typing import Any, ClassVar
 
 
-@dataclass
+@dataclass(slots=True)
 class Connection:
     """SSH接続情報"""
 
+    # to_dict で出力するフィールド (フィールド追加時はここにも追加する)
+    _FIELD_NAMES: ClassVar[tuple[str, ...]] = (
+        "name", "host", "port", "auth_type", "username", "password", "key_path",
+        "prompt", "sendln_param", "id", "created_at", "updated_at",
+    )
+    # from_dict で受け付けるフィールド
+    _VALID_FIELDS: ClassVar[frozenset[str]] = frozenset(_FIELD_NAMES)
+
     name: str = ""
     host: str = ""
     port: int = 22
@@ -21,18 +29,18 @@ class Connection:
     key_path: str = ""  # 鍵ファイルのフルパス
     prompt: str = ""  # ログイン後に待つプロンプト
     sendln_param: str = ""  # プロンプト後に送るコマンド
-    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = field(default_factory=lambda: os.urandom(16).hex())
     created_at: str = field(default_factory=lambda: datetime.now().isoformat())
     updated_at: str = field(default_factory=lambda: datetime.now().isoformat())
 
     def to_dict(self) -> dict[str, Any]:
-        return asdict(self)
+        # フィールドは str/int のみなので asdict の再帰コピーは不要
+        return {f: getattr(self, f) for f in self._FIELD_NAMES}
 
     @classmethod
     def from_dict(cls, data: dict[str, Any]) -> Connection:
         # 未知のフィールドは無視
-        valid_fields = {f.name for f in cls.__dataclass_fields__.values()}
-        filtered = {k: v for k, v in data.items() if k in valid_fields}
+        filtered = {k: v for k, v in data.items() if k in cls._VALID_FIELDS}
         return cls(**filtered)
 
     @property
@@ -44,18 +52,21 @@ class Connection:
         return f"{self.host}:{self.port}"
 
 
-@dataclass
+@dataclass(slots=True)
 class AppSettings:
     """アプリケーション設定"""
 
+    _FIELD_NAMES: ClassVar[tuple[str, ...]] = ("ttpmacro_path", "log_dir")
+    _VALID_FIELDS: ClassVar[frozenset[str]] = frozenset(_FIELD_NAMES)
+
     ttpmacro_path: str = ""
     log_dir: str = ""
 
     def to_dict(self) -> dict[str, Any]:
-        return asdict(self)
+        # フィールドは str/int のみなので asdict の再帰コピーは不要
+        return {f: getattr(self, f) for f in self._FIELD_NAMES}
 
     @classmethod
     def from_dict(cls, data: dict[str, Any]) -> AppSettings:
-        valid_fields = {f.name for f in cls.__dataclass_fields__.values()}
-        filtered = {k: v for k, v in data.items() if k in valid_fields}
+        filtered = {k: v for k, v in data.items() if k in cls._VALID_FIELDS}
         return cls(**filtered)
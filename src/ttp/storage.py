@@ -6,12 +6,20 @@
 
 from __future__ import annotations
 
+import functools
 import json
 import os
 import sys
 from pathlib import Path
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # 未インストール時は標準の json を使う
+    orjson = None
 
 from ttp.crypto import (
+    calibrate_iterations,
     generate_salt,
     derive_key,
     create_verify_token,
@@ -22,6 +30,23 @@ from ttp.crypto import (
 from ttp.models import Connection, AppSettings
 
 
+def _dumps(obj: Any, indent: bool = False) -> bytes:
+    """オブジェクトを UTF-8 の JSON バイト列にする。orjson があれば使う。"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(data: bytes) -> Any:
+    """UTF-8 の JSON バイト列を読み込む。orjson があれば使う。"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+@functools.cache
 def get_app_dir() -> Path:
     """アプリのルートディレクトリを返す。
 
@@ -44,7 +69,10 @@ def get_data_dir() -> Path:
 
 
 def get_log_dir(settings: AppSettings | None = None) -> Path:
-    """ログディレクトリのパスを返す。"""
+    """ログディレクトリのパスを返す。
+
+    実行中に削除されても作り直せるよう、作成は呼ばれるたびに行う。
+    """
     if settings and settings.log_dir:
         d = Path(settings.log_dir)
     else:
@@ -53,6 +81,7 @@ def get_log_dir(settings: AppSettings | None = None) -> Path:
     return d
 
 
+@functools.cache
 def get_resource_dir() -> Path:
     """リソースディレクトリを返す。"""
     if getattr(sys, "frozen", False):
@@ -61,6 +90,24 @@ def get_resource_dir() -> Path:
         return get_app_dir() / "resources"
 
 
+def _write_temp_files(files: list[tuple[Path, bytes]]) -> list[Path]:
+    """各ファイルの内容を隣の一時ファイル (*.tmp) に書き、そのパスを返す。
+
+    途中で失敗した場合は書いた一時ファイルを消す。既存のファイルには触れない。
+    """
+    written: list[Path] = []
+    try:
+        for path, data in files:
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_bytes(data)
+            written.append(tmp)
+    except BaseException:
+        for tmp in written:
+            tmp.unlink(missing_ok=True)
+        raise
+    return written
+
+
 # ── マスターパスワード ──────────────────────────────────────
 
 
@@ -69,39 +116,75 @@ class MasterStore:
 
     def __init__(self) -> None:
         self._path = get_data_dir() / "master.json"
+        # master.json の内容 (一度読んだら使い回す)
+        self._data: dict[str, Any] | None = None
 
     def exists(self) -> bool:
-        return self._path.is_file()
+        return self._data is not None or self._path.is_file()
+
+    def _read(self) -> dict[str, Any]:
+        if self._data is None:
+            self._data = json.loads(self._path.read_text(encoding="utf-8"))
+        return self._data
 
-    def setup(self, master_password: str) -> bytes:
-        """マスターパスワードを設定し、導出鍵を返す。"""
+    def _new_master(self, master_password: str) -> tuple[bytes, dict[str, Any]]:
+        """新しい salt で鍵を導出し、(鍵, master.json の内容) を返す。"""
         salt = generate_salt()
-        key = derive_key(master_password, salt)
+        iterations = calibrate_iterations()
+        key = derive_key(master_password, salt, iterations)
         token = create_verify_token(key)
         data = {
             "salt": salt.hex(),
+            "iterations": iterations,
             "verify_token": token.decode("utf-8"),
         }
-        self._path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+        return key, data
+
+    def setup_with_connections(
+        self,
+        master_password: str,
+        conn_store: ConnectionStore,
+        connections: list[Connection] | None = None,
+    ) -> bytes:
+        """マスターパスワードを設定し、接続情報も新しい鍵で保存して導出鍵を返す。
+
+        途中で中断した場合の扱いは ConnectionStore.save_with_files を参照。
+        """
+        key, data = self._new_master(master_password)
+        conn_store.save_with_files(
+            connections or [],
+            key,
+            [(self._path, json.dumps(data, indent=2).encode("utf-8"))],
+        )
+        self._data = data
         return key
 
     def unlock(self, master_password: str) -> bytes | None:
         """マスターパスワードを検証し、正しければ導出鍵を返す。"""
-        data = json.loads(self._path.read_text(encoding="utf-8"))
+        try:
+            data = self._read()
+        except FileNotFoundError:
+            return None
         salt = bytes.fromhex(data["salt"])
         token = data["verify_token"].encode("utf-8")
-        key = derive_key(master_password, salt)
+        key = derive_key(master_password, salt, data.get("iterations"))
         if verify_master_password(token, key):
             return key
         return None
 
-    def change_password(self, old_password: str, new_password: str) -> bytes | None:
-        """マスターパスワードを変更する。接続情報の再暗号化が必要。"""
+    def change_password(
+        self, old_password: str, new_password: str, conn_store: ConnectionStore
+    ) -> tuple[bytes, bytes] | None:
+        """マスターパスワードを変更し、接続情報を新しい鍵で再暗号化する。
+
+        現在のパスワードが違う場合は None、成功時は (旧鍵, 新鍵) を返す。
+        """
         old_key = self.unlock(old_password)
         if old_key is None:
             return None
-        new_key = self.setup(new_password)
-        return new_key
+        connections = conn_store.load(old_key)
+        new_key = self.setup_with_connections(new_password, conn_store, connections)
+        return old_key, new_key
 
 
 # ── 接続情報 ──────────────────────────────────────────────
@@ -112,33 +195,66 @@ class ConnectionStore:
 
     def __init__(self) -> None:
         self._path = get_data_dir() / "connections.enc"
+        # 鍵の変更中だけ残る、変更前の接続情報
+        self._backup = self._path.with_name(self._path.name + ".bak")
 
     def load(self, key: bytes) -> list[Connection]:
-        """接続情報を復号化して読み込む。"""
-        if not self._path.is_file():
-            return []
-        encrypted = self._path.read_bytes()
+        """接続情報を復号化して読み込む。
+
+        読めない場合は鍵の変更が途中で止まった可能性があるので、
+        変更前のファイル (.bak) が key で読めればそれを戻して使う。
+        """
+        connections = self._read(self._path, key)
+        if connections is None:
+            connections = self._read(self._backup, key)
+            if connections is None:
+                return []
+            os.replace(self._backup, self._path)
+        return connections
+
+    def _read(self, path: Path, key: bytes) -> list[Connection] | None:
+        """path を key で復号して返す。ファイルが無いか復号できなければ None。"""
+        try:
+            encrypted = path.read_bytes()
+        except FileNotFoundError:
+            return None
         if not encrypted:
             return []
         try:
-            decrypted = decrypt(encrypted, key)
-            data = json.loads(decrypted.decode("utf-8"))
+            # 復号結果の bytes をデコードせずにそのまま JSON パーサへ渡す
+            data = _loads(decrypt(encrypted, key))
             return [Connection.from_dict(c) for c in data.get("connections", [])]
         except Exception:
-            return []
+            return None
 
     def save(self, connections: list[Connection], key: bytes) -> None:
         """接続情報を暗号化して保存する。"""
+        self._path.write_bytes(self._encode(connections, key))
+
+    def save_with_files(
+        self, connections: list[Connection], key: bytes, files: list[tuple[Path, bytes]]
+    ) -> None:
+        """接続情報と files (master.json 等) をまとめて保存する。
+
+        すべて一時ファイルに書いてから、connections.enc → files の順に置き換える。
+        置き換えの途中で中断すると、connections.enc と master.json の鍵が食い違う。
+        その場合に備えて変更前の connections.enc を .bak に移しておき、最後に消す。
+        中断後は load() が .bak から復旧する。
+        """
+        targets = [(self._path, self._encode(connections, key)), *files]
+        written = _write_temp_files(targets)
+        try:
+            os.replace(self._path, self._backup)
+        except FileNotFoundError:
+            pass
+        for tmp, (path, _) in zip(written, targets):
+            os.replace(tmp, path)
+        self._backup.unlink(missing_ok=True)
+
+    def _encode(self, connections: list[Connection], key: bytes) -> bytes:
         data = {"connections": [c.to_dict() for c in connections]}
-        plaintext = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
-        encrypted = encrypt(plaintext, key)
-        self._path.write_bytes(encrypted)
-
-    def re_encrypt(self, old_key: bytes, new_key: bytes) -> bool:
-        """古い鍵で復号→新しい鍵で再暗号化する。"""
-        connections = self.load(old_key)
-        self.save(connections, new_key)
-        return True
+        # 暗号化して保存するので整形は不要
+        return encrypt(_dumps(data), key)
 
 
 # ── アプリ設定 ──────────────────────────────────────────────
@@ -151,16 +267,13 @@ class SettingsStore:
         self._path = get_data_dir() / "settings.json"
 
     def load(self) -> AppSettings:
-        if not self._path.is_file():
-            return AppSettings()
         try:
-            data = json.loads(self._path.read_text(encoding="utf-8"))
+            data = _loads(self._path.read_bytes())
             return AppSettings.from_dict(data)
         except Exception:
+            # ファイルが無い (FileNotFoundError) 場合も既定値
             return AppSettings()
 
     def save(self, settings: AppSettings) -> None:
-        self._path.write_text(
-            json.dumps(settings.to_dict(), ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
+        # settings.json は手で編集されることがあるので整形して保存する
+        self._path.write_bytes(_dumps(settings.to_dict(), indent=True))
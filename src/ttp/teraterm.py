@@ -5,67 +5,143 @@ ttpmacro.exe の自動検出、マクロ実行、ログ管理を行う。
 
 from __future__ import annotations
 
+import functools
 import os
-import subprocess
-from datetime import datetime
+import time
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 from ttp.models import Connection, AppSettings
 from ttp.storage import get_log_dir, get_resource_dir
 
+if TYPE_CHECKING:
+    import subprocess
 
-# ttpmacro.exe の検索パス (新しいバージョン優先)
+
+# ttpmacro.exe の検索パス (環境変数, フォルダ名)。新しいバージョン優先
 _SEARCH_PATHS = [
-    r"{PROGRAMFILES}\teraterm5\ttpmacro.exe",
-    r"{PROGRAMFILES(X86)}\teraterm5\ttpmacro.exe",
-    r"{PROGRAMFILES}\teraterm\ttpmacro.exe",
-    r"{PROGRAMFILES(X86)}\teraterm\ttpmacro.exe",
+    ("PROGRAMFILES", "teraterm5"),
+    ("PROGRAMFILES(X86)", "teraterm5"),
+    ("PROGRAMFILES", "teraterm"),
+    ("PROGRAMFILES(X86)", "teraterm"),
 ]
 
+# 環境変数が無い場合の既定値
+_PROGRAM_FILES_DEFAULTS = {
+    "PROGRAMFILES": r"C:\Program Files",
+    "PROGRAMFILES(X86)": r"C:\Program Files (x86)",
+}
+
+# subprocess.CREATE_NO_WINDOW と同じ値 (subprocess を起動時に import しないため)
+_CREATE_NO_WINDOW = 0x08000000
+
+# ttpmacro.exe の存在確認を省略できる秒数
+_VALIDATION_TTL = 300.0
+
+# 最後に存在を確認できた ttpmacro.exe のパスと時刻 (time.monotonic)
+_ttpmacro_checked: tuple[str, float] | None = None
+
+# ファイル名に使えない文字を "_" に置き換える変換表
+_FORBIDDEN = str.maketrans(dict.fromkeys('/\\:*?"<>|', "_"))
+# 同じ変換表の bytes 版 (ASCII のみの名前用)
+_FORBIDDEN_BYTES = bytes.maketrans(b'/\\:*?"<>|', b"_" * 9)
+
+
+def _expand_search_paths() -> list[str]:
+    """_SEARCH_PATHS を環境変数に従ってフルパスに展開する。
+
+    32bit 環境などで PROGRAMFILES と PROGRAMFILES(X86) が同じ場合があるので、
+    重複を除いて同じファイルを二度 stat しないようにする。
+    """
+    paths = (
+        os.path.join(
+            os.environ.get(var, _PROGRAM_FILES_DEFAULTS[var]), sub, "ttpmacro.exe"
+        )
+        for var, sub in _SEARCH_PATHS
+    )
+    return list(dict.fromkeys(paths))
+
+
+# 展開済みの検索パス (環境変数はプロセス内で変わらないので起動時に1回だけ展開)
+_EXPANDED_SEARCH_PATHS = _expand_search_paths()
+
+# 検索結果を使い回す秒数
+_SEARCH_TTL = 60.0
 
-def search_ttpmacro() -> list[str]:
-    """ttpmacro.exe をよくある場所から検索し、見つかったパスのリストを返す。"""
-    found: list[str] = []
-    env_map = {
-        "PROGRAMFILES": os.environ.get("PROGRAMFILES", r"C:\Program Files"),
-        "PROGRAMFILES(X86)": os.environ.get(
-            "PROGRAMFILES(X86)", r"C:\Program Files (x86)"
-        ),
-    }
-    for template in _SEARCH_PATHS:
-        path = template
-        for var, val in env_map.items():
-            path = path.replace(f"{{{var}}}", val)
-        if os.path.isfile(path):
-            found.append(path)
-    return found
+# 直近の検索結果 (検索した時刻, 見つかったパス)
+_search_cache: tuple[float, list[str]] | None = None
 
 
+def search_ttpmacro(force: bool = False) -> list[str]:
+    """ttpmacro.exe をよくある場所から検索し、見つかったパスのリストを返す。
+
+    直近 _SEARCH_TTL 秒以内の結果があればそれを返す。force=True で必ず検索し直す。
+    """
+    global _search_cache
+    now = time.monotonic()
+    if (
+        not force
+        and _search_cache is not None
+        and now - _search_cache[0] < _SEARCH_TTL
+    ):
+        return list(_search_cache[1])
+    found = [path for path in _EXPANDED_SEARCH_PATHS if os.path.isfile(path)]
+    _search_cache = (now, found)
+    return list(found)
+
+
+# connect.ttl の存在を確認済みか (同梱ファイルなので一度確認できれば十分)
+_macro_checked = False
+
+
+@functools.cache
 def get_macro_path() -> str:
     """connect.ttl マクロのパスを返す。"""
     return str(get_resource_dir() / "connect.ttl")
 
 
+def _sanitize_filename(name: str) -> str:
+    """ファイル名に使えない文字を "_" に置き換える。"""
+    try:
+        # ASCII のみなら bytes.translate の方が速い
+        return name.encode("ascii").translate(_FORBIDDEN_BYTES).decode("ascii")
+    except UnicodeEncodeError:
+        return name.translate(_FORBIDDEN)
+
+
 def generate_log_filename(connection: Connection, settings: AppSettings) -> str:
     """ログファイルのフルパスを生成する。"""
     log_dir = get_log_dir(settings)
-    now = datetime.now()
-    # ファイル名に使えない文字を除去
-    safe_name = (
-        connection.name.replace("/", "_")
-        .replace("\\", "_")
-        .replace(":", "_")
-        .replace("*", "_")
-        .replace("?", "_")
-        .replace('"', "_")
-        .replace("<", "_")
-        .replace(">", "_")
-        .replace("|", "_")
+    t = time.localtime()
+    stamp = (
+        f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d}"
+        f"_{t.tm_hour:02d}{t.tm_min:02d}{t.tm_sec:02d}"
     )
-    filename = f"{now.strftime('%Y-%m-%d_%H%M%S')}_{safe_name}.log"
+    # ファイル名に使えない文字を除去
+    safe_name = _sanitize_filename(connection.name)
+    filename = f"{stamp}_{safe_name}.log"
     return str(log_dir / filename)
 
 
+def ttpmacro_exists(path: str) -> bool:
+    """ttpmacro.exe が存在するか。直近 _VALIDATION_TTL 秒以内に確認済みなら stat しない。"""
+    global _ttpmacro_checked
+    if not path:
+        return False
+    now = time.monotonic()
+    if (
+        _ttpmacro_checked is not None
+        and _ttpmacro_checked[0] == path
+        and now - _ttpmacro_checked[1] < _VALIDATION_TTL
+    ):
+        return True
+    if not os.path.isfile(path):
+        _ttpmacro_checked = None
+        return False
+    _ttpmacro_checked = (path, now)
+    return True
+
+
 def launch_connection(
     connection: Connection,
     settings: AppSettings,
@@ -76,13 +152,16 @@ def launch_connection(
     - 鍵認証の場合は ttp_data/keys/ に保存された鍵ファイルのパスを渡す
     - ログファイルを自動設定
     """
+    global _macro_checked, _ttpmacro_checked
     ttpmacro = settings.ttpmacro_path
-    if not ttpmacro or not os.path.isfile(ttpmacro):
+    if not ttpmacro_exists(ttpmacro):
         return None
 
     macro_path = get_macro_path()
-    if not os.path.isfile(macro_path):
-        return None
+    if not _macro_checked:
+        if not os.path.isfile(macro_path):
+            return None
+        _macro_checked = True
 
     try:
         log_path = generate_log_filename(connection, settings)
@@ -91,31 +170,34 @@ def launch_connection(
         settings.log_dir = ""
         log_path = generate_log_filename(connection, settings)
 
-    # 鍵ファイルパス (publickey認証時)
-    key_path = ""
-    if connection.auth_type == "publickey" and connection.key_path:
-        if os.path.isfile(connection.key_path):
-            key_path = connection.key_path
+    # 鍵ファイルパス (publickey認証時)。存在しない場合は Tera Term 側でエラーになる
+    key_path = connection.key_path if connection.auth_type == "publickey" else ""
 
     # 環境変数を構築
     env = os.environ.copy()
-    env["TT_TTL_HOST"] = connection.host
-    env["TT_TTL_PORT"] = str(connection.port)
-    env["TT_TTL_AUTH"] = connection.auth_type
-    env["TT_TTL_USER"] = connection.username
-    env["TT_TTL_PASSWD"] = connection.password
-    env["TT_TTL_PRIVATEKEY"] = key_path
-    env["TT_TTL_PROMPT"] = connection.prompt
-    env["TT_TTL_SENDLN_PARAM"] = connection.sendln_param
-    env["TT_TTL_LOGPATH"] = log_path
+    env.update({
+        "TT_TTL_HOST": connection.host,
+        "TT_TTL_PORT": str(connection.port),
+        "TT_TTL_AUTH": connection.auth_type,
+        "TT_TTL_USER": connection.username,
+        "TT_TTL_PASSWD": connection.password,
+        "TT_TTL_PRIVATEKEY": key_path,
+        "TT_TTL_PROMPT": connection.prompt,
+        "TT_TTL_SENDLN_PARAM": connection.sendln_param,
+        "TT_TTL_LOGPATH": log_path,
+    })
+
+    import subprocess
 
     try:
         proc = subprocess.Popen(
             [ttpmacro, macro_path],
             env=env,
-            creationflags=subprocess.CREATE_NO_WINDOW,
+            creationflags=_CREATE_NO_WINDOW,
         )
     except Exception:
+        # 確認後に消えた可能性があるので、次回は存在確認からやり直す
+        _ttpmacro_checked = None
         return None
 
     return proc